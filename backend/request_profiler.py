@@ -0,0 +1,116 @@
+"""Sampling wall-clock profiler for single requests, with flamegraph-ready output"""
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Innermost matching frame decides where a sample's time went
+CATEGORIES = (
+    ("sql", ("sqlalchemy", "pymysql", "MySQLdb", "sqlite3")),
+    ("qr", ("qrcode", "PIL", "png", "ticket_print")),
+    ("pydantic", ("pydantic",)),
+    ("json", ("json", "fastapi.encoders", "starlette.responses")),
+    ("waiting", ("selectors", "asyncio.base_events")),
+)
+MAX_DEPTH = 128
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def categorize(labels: List[str]) -> str:
+    for label in reversed(labels):
+        module = label.split(":", 1)[0]
+        for category, prefixes in CATEGORIES:
+            if any(module == prefix or module.startswith(prefix + ".") for prefix in prefixes):
+                return category
+    return "other"
+
+
+class RequestProfile:
+    """Samples one thread's stack every interval until stopped"""
+
+    def __init__(self, method: str, path: str, thread_id: int, interval: float, reason: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.thread_id = thread_id
+        self.interval = interval
+        self.status = None
+        self.started_at = datetime.utcnow()
+        self.duration = 0.0
+        self.stacks = Counter()
+        self.categories = Counter()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name=f"profile-{self.id}", daemon=True)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self, status: Optional[int]):
+        self.duration = time.perf_counter() - self._started
+        self.status = status
+        self._stopped.set()
+        self._sampler.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None and len(labels) < MAX_DEPTH:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                labels.reverse()
+                self.stacks[";".join(labels)] += 1
+                self.categories[categorize(labels)] += 1
+
+    def summary(self) -> Dict:
+        samples = sum(self.categories.values())
+        breakdown = {
+            category: round(self.duration * 1000 * count / samples, 2)
+            for category, count in self.categories.most_common()
+        } if samples else {}
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "samples": samples,
+            "breakdown_ms": breakdown,
+        }
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format: one "frame;frame;frame count" line per distinct stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """Ring buffer of the most recent profiles"""
+
+    def __init__(self, size: int):
+        self.profiles = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, profile: RequestProfile):
+        with self.lock:
+            self.profiles.append(profile)
+
+    def list(self) -> List[RequestProfile]:
+        with self.lock:
+            return list(reversed(self.profiles))
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self.lock:
+            return next((profile for profile in self.profiles if profile.id == profile_id), None)
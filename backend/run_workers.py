@@ -0,0 +1,98 @@
+"""Run server:app under several worker processes sharing one listening socket.
+
+    cd backend
+    python run_workers.py --host 0.0.0.0 --port 5025 --workers 4
+
+On Linux/macOS the app is imported once in this process and the workers are forked
+from it (preload), so code and module state are loaded a single time and a crashed
+worker is replaced immediately. Windows has no fork; there the workers are started by
+uvicorn itself and each imports the app on its own.
+
+WORKERS is exported to the workers, which turns on the cross-worker cache and event
+channel in server.py (cluster_events table). READ_YOUR_WRITES_SECRET is exported too, unless
+already set, so a read-your-writes token issued by one worker is honoured by the others.
+"""
+import argparse
+import os
+import secrets
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5025)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args()
+
+
+def run_forked(args):
+    import server  # preload before forking
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children = {}
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # Connections opened by the parent must not be shared with the children
+            server.engine.dispose(close=False)
+            config = uvicorn.Config(server.app, log_level=args.log_level)
+            uvicorn.Server(config).run(sockets=[sock])
+            os._exit(0)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(args.workers):
+        spawn(index)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers", file=sys.stderr)
+
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            time.sleep(1)
+            spawn(index)
+
+
+def main():
+    args = parse_args()
+    os.environ["WORKERS"] = str(args.workers)
+    os.environ.setdefault("READ_YOUR_WRITES_SECRET", secrets.token_hex(32))
+    if args.workers > 1 and hasattr(os, "fork"):
+        run_forked(args)
+    else:
+        uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
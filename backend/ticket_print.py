@@ -0,0 +1,171 @@
+"""Streaming renderers for printable ticket sheets (80mm PDF and ESC/POS)"""
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple
+
+import qrcode
+
+MM = 72 / 25.4
+PAGE_WIDTH = 80 * MM
+TICKET_HEIGHT = 38 * MM
+MARGIN = 5 * MM
+QR_SIZE = 28 * MM
+TICKETS_PER_PAGE = 6
+
+# QR matrices are built in a small pool so the next page is ready while the current one is sent
+render_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ticket-qr")
+
+
+class PrintableTicket(NamedTuple):
+    ticket_number: str
+    product_id: str
+    product_name: str
+    product_value: float
+    is_redeemed: bool
+    created_at: datetime
+
+
+def ticket_lines(ticket: PrintableTicket) -> List[str]:
+    return [
+        f"Ticket: {ticket.ticket_number}",
+        f"Valor: R$ {ticket.product_value:.2f}",
+        f"Status: {'Resgatado' if ticket.is_redeemed else 'Ativo'}",
+        f"Data: {ticket.created_at.strftime('%d/%m/%Y %H:%M:%S')}",
+    ]
+
+
+def qr_matrix(data: str) -> List[List[bool]]:
+    qr = qrcode.QRCode(border=1, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def qr_image_xobject(data: str) -> bytes:
+    """1-bit DeviceGray image of the QR code, deflated; the PDF viewer does the scaling"""
+    matrix = qr_matrix(data)
+    size = len(matrix)
+    rows = bytearray()
+    for row in matrix:
+        bits = 0
+        for index, dark in enumerate(row):
+            bits = (bits << 1) | (0 if dark else 1)
+        padding = (-size) % 8
+        rows += (bits << padding).to_bytes((size + padding) // 8, "big")
+    stream = zlib.compress(bytes(rows))
+    header = (
+        f"<< /Type /XObject /Subtype /Image /Width {size} /Height {size} "
+        f"/ColorSpace /DeviceGray /BitsPerComponent 1 /Interpolate false "
+        f"/Filter /FlateDecode /Length {len(stream)} >>\nstream\n"
+    ).encode()
+    return header + stream + b"\nendstream"
+
+
+def pdf_text(value: str) -> str:
+    encoded = value.encode("cp1252", errors="replace").decode("latin-1")
+    return encoded.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_content(tickets: List[PrintableTicket], page_height: float) -> bytes:
+    ops = []
+    for slot, ticket in enumerate(tickets):
+        top = page_height - slot * TICKET_HEIGHT
+        ops.append(f"q [3 2] 0 d 0.7 G {MARGIN:.2f} {top - TICKET_HEIGHT + 2:.2f} {PAGE_WIDTH - 2 * MARGIN:.2f} {TICKET_HEIGHT - 4:.2f} re S Q")
+        ops.append(f"BT /F2 10 Tf {MARGIN + 4:.2f} {top - 16:.2f} Td ({pdf_text(ticket.product_name[:28])}) Tj ET")
+        for line_number, line in enumerate(ticket_lines(ticket)):
+            ops.append(f"BT /F1 8 Tf {MARGIN + 4:.2f} {top - 32 - line_number * 11:.2f} Td ({pdf_text(line)}) Tj ET")
+        qr_x = PAGE_WIDTH - MARGIN - QR_SIZE - 4
+        qr_y = top - TICKET_HEIGHT + (TICKET_HEIGHT - QR_SIZE) / 2
+        ops.append(f"q {QR_SIZE:.2f} 0 0 {QR_SIZE:.2f} {qr_x:.2f} {qr_y:.2f} cm /Q{slot} Do Q")
+    return zlib.compress("\n".join(ops).encode("latin-1"))
+
+
+def render_pdf(tickets: List[PrintableTicket], tickets_per_page: int = TICKETS_PER_PAGE) -> Iterator[bytes]:
+    """Yield a PDF one page at a time; fonts are written once and shared by every page"""
+    offsets = {}
+    position = 0
+    page_ids = []
+
+    def emit(number: int, body: bytes) -> bytes:
+        nonlocal position
+        offsets[number] = position
+        chunk = f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+        position += len(chunk)
+        return chunk
+
+    def raw(chunk: bytes) -> bytes:
+        nonlocal position
+        position += len(chunk)
+        return chunk
+
+    # 1: catalog, 2: page tree (written last, once every page is known), 3/4: shared fonts
+    yield raw(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    yield emit(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    yield emit(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+    next_number = 5
+
+    images = render_pool.map(qr_image_xobject, [ticket.ticket_number for ticket in tickets])
+    for start in range(0, len(tickets), tickets_per_page):
+        page_tickets = tickets[start:start + tickets_per_page]
+        page_height = TICKET_HEIGHT * len(page_tickets)
+        image_ids = []
+        chunks = []
+        for _ in page_tickets:
+            chunks.append(emit(next_number, next(images)))
+            image_ids.append(next_number)
+            next_number += 1
+        content = page_content(page_tickets, page_height)
+        content_id = next_number
+        chunks.append(emit(content_id, f"<< /Filter /FlateDecode /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream"))
+        page_id = content_id + 1
+        xobjects = " ".join(f"/Q{slot} {number} 0 R" for slot, number in enumerate(image_ids))
+        chunks.append(emit(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH:.2f} {page_height:.2f}] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> /XObject << {xobjects} >> >> "
+            f"/Contents {content_id} 0 R >>"
+        ).encode()))
+        page_ids.append(page_id)
+        next_number = page_id + 1
+        yield b"".join(chunks)
+
+    kids = " ".join(f"{number} 0 R" for number in page_ids)
+    yield emit(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode())
+
+    xref_position = position
+    xref = [f"xref\n0 {next_number}\n", "0000000000 65535 f \n"]
+    xref.extend(f"{offsets[number]:010d} 00000 n \n" for number in range(1, next_number))
+    xref.append(f"trailer\n<< /Size {next_number} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n")
+    yield raw("".join(xref).encode())
+
+
+# ESC/POS: the printer renders the QR itself (GS ( k), so only the ticket number is sent
+ESC_INIT = b"\x1b@" + b"\x1bt\x02"  # reset, code page PC850
+ESC_QR_SETUP = (
+    b"\x1d(k\x04\x001A2\x00"  # model 2
+    b"\x1d(k\x03\x001C\x06"  # module size 6
+    b"\x1d(k\x03\x001E1"  # error correction M
+)
+ESC_QR_PRINT = b"\x1d(k\x03\x001Q0"
+ESC_CUT = b"\n\n\n\x1dVB\x00"
+
+
+def escpos_text(value: str) -> bytes:
+    return value.encode("cp850", errors="replace")
+
+
+def render_escpos(tickets: Iterable[PrintableTicket]) -> Iterator[bytes]:
+    """Yield one ESC/POS job chunk per ticket, each ending with a partial cut"""
+    yield ESC_INIT
+    for ticket in tickets:
+        data = escpos_text(ticket.ticket_number)
+        length = len(data) + 3
+        chunk = bytearray()
+        chunk += b"\x1ba\x01\x1bE\x01" + escpos_text(ticket.product_name) + b"\n\x1bE\x00\x1ba\x00"
+        for line in ticket_lines(ticket):
+            chunk += escpos_text(line) + b"\n"
+        chunk += b"\x1ba\x01" + ESC_QR_SETUP
+        chunk += b"\x1d(k" + bytes([length % 256, length // 256]) + b"1P0" + data
+        chunk += ESC_QR_PRINT + b"\x1ba\x00" + ESC_CUT
+        yield bytes(chunk)
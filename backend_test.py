@@ -8,7 +8,7 @@ import requests
 import json
 import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Get backend URL from environment
 BACKEND_URL = "https://5cbb35e1-e4b7-4365-a186-473197fe43d8.preview.emergentagent.com/api"
@@ -67,7 +67,7 @@ class BackendTester:
                 self.created_products.append(product)
                 
                 # Verify all required fields are present
-                required_fields = ["id", "product_id", "name", "value", "stock", "qr_code_data", "qr_code_image"]
+                required_fields = ["id", "product_id", "name", "value", "stock", "qr_code_data", "qr_code_url"]
                 missing_fields = [field for field in required_fields if field not in product]
                 
                 if missing_fields:
@@ -75,7 +75,7 @@ class BackendTester:
                     return False
                 
                 # Verify QR code was generated
-                if not product.get("qr_code_data") or not product.get("qr_code_image"):
+                if not product.get("qr_code_data") or not product.get("qr_code_url"):
                     self.log_test("Product Creation", False, "QR code not generated")
                     return False
                 
@@ -507,6 +507,394 @@ class BackendTester:
             self.log_test("Nonexistent Product Operations", False, f"Exception: {str(e)}")
             return False
     
+    def test_idempotent_ticket_creation(self):
+        """Test that a retried ticket issuance with the same Idempotency-Key is replayed"""
+        if not self.created_products:
+            self.log_test("Idempotent Ticket Creation", False, "No products created to test")
+            return False
+            
+        try:
+            product = self.created_products[0]
+            ticket_data = {"product_id": product["product_id"], "quantity": 2}
+            headers = {"Idempotency-Key": str(uuid.uuid4())}
+            
+            first = requests.post(f"{self.base_url}/tickets", json=ticket_data, headers=headers, timeout=10)
+            retry = requests.post(f"{self.base_url}/tickets", json=ticket_data, headers=headers, timeout=10)
+            
+            if first.status_code != 200 or retry.status_code != 200:
+                self.log_test("Idempotent Ticket Creation", False, f"Expected 200/200, got {first.status_code}/{retry.status_code}")
+                return False
+            
+            if first.json() != retry.json():
+                self.log_test("Idempotent Ticket Creation", False, "Retry issued different tickets")
+                return False
+            
+            # Reusing the key for a different request must be rejected
+            ticket_data["quantity"] = 3
+            mismatch = requests.post(f"{self.base_url}/tickets", json=ticket_data, headers=headers, timeout=10)
+            if mismatch.status_code != 422:
+                self.log_test("Idempotent Ticket Creation", False, f"Key reuse: Expected 422, got {mismatch.status_code}")
+                return False
+            
+            self.log_test("Idempotent Ticket Creation", True, "Retried issuance replayed the original tickets")
+            return True
+            
+        except Exception as e:
+            self.log_test("Idempotent Ticket Creation", False, f"Exception: {str(e)}")
+            return False
+    
+    def test_delta_sync(self):
+        """Test that /sync returns only changes made after the cursor"""
+        if not self.created_products:
+            self.log_test("Delta Sync", False, "No products created to test")
+            return False
+            
+        try:
+            # Walk every page of the snapshot so the cursor ends up at the end of the pass
+            params = {}
+            while True:
+                snapshot = requests.get(f"{self.base_url}/sync", params=params, timeout=10)
+                if snapshot.status_code != 200 or "cursor" not in snapshot.json():
+                    self.log_test("Delta Sync", False, f"Snapshot failed with status {snapshot.status_code}")
+                    return False
+                params = {"since": snapshot.json()["cursor"]}
+                if not snapshot.json()["has_more"]:
+                    break
+            
+            cursor = params["since"]
+            product = self.created_products[0]
+            ticket_data = {"product_id": product["product_id"], "quantity": 1}
+            created = requests.post(f"{self.base_url}/tickets", json=ticket_data, timeout=10)
+            if created.status_code != 200:
+                self.log_test("Delta Sync", False, f"Ticket creation failed with status {created.status_code}")
+                return False
+            
+            delta = requests.get(f"{self.base_url}/sync", params={"since": cursor}, timeout=10)
+            if delta.status_code != 200:
+                self.log_test("Delta Sync", False, f"Delta failed with status {delta.status_code}")
+                return False
+            
+            ticket_ids = [ticket["id"] for ticket in delta.json()["tickets"]]
+            if created.json()[0]["id"] not in ticket_ids:
+                self.log_test("Delta Sync", False, "New ticket missing from delta")
+                return False
+            
+            self.log_test("Delta Sync", True, f"Delta returned {len(ticket_ids)} changed tickets")
+            return True
+            
+        except Exception as e:
+            self.log_test("Delta Sync", False, f"Exception: {str(e)}")
+            return False
+    
+    def test_stock_adjustment(self):
+        """Test atomic stock adjustments and the inventory ledger"""
+        if not self.created_products:
+            self.log_test("Stock Adjustment", False, "No products created to test")
+            return False
+            
+        try:
+            product_id = self.created_products[0]["product_id"]
+            current = requests.get(f"{self.base_url}/products/{product_id}", timeout=10).json()
+            
+            response = requests.post(f"{self.base_url}/products/{product_id}/stock", json={"delta": 3}, timeout=10)
+            if response.status_code != 200 or response.json()["stock"] != current["stock"] + 3:
+                self.log_test("Stock Adjustment", False, f"Adding stock failed with status {response.status_code}")
+                return False
+            
+            # Removing more than is available must be rejected
+            response = requests.post(f"{self.base_url}/products/{product_id}/stock", json={"delta": -(current["stock"] + 10)}, timeout=10)
+            if response.status_code != 409:
+                self.log_test("Stock Adjustment", False, f"Negative stock: Expected 409, got {response.status_code}")
+                return False
+            
+            history = requests.get(f"{self.base_url}/products/{product_id}/stock/history", timeout=10).json()
+            if not history or history[0]["delta"] != 3 or history[0]["reason"] != "adjust":
+                self.log_test("Stock Adjustment", False, "Adjustment missing from the ledger")
+                return False
+            
+            self.log_test("Stock Adjustment", True, f"Stock moved from {current['stock']} to {current['stock'] + 3} and was recorded")
+            return True
+            
+        except Exception as e:
+            self.log_test("Stock Adjustment", False, f"Exception: {str(e)}")
+            return False
+    
+    def test_bulk_ticket_job(self):
+        """Test that oversized ticket requests are handed off to a background job"""
+        if not self.created_products:
+            self.log_test("Bulk Ticket Job", False, "No products created to test")
+            return False
+            
+        try:
+            product_id = self.created_products[0]["product_id"]
+            headers = {"Idempotency-Key": str(uuid.uuid4())}
+            response = requests.post(f"{self.base_url}/tickets", json={"product_id": product_id, "quantity": 250}, headers=headers, timeout=10)
+            if response.status_code != 202:
+                self.log_test("Bulk Ticket Job", False, f"Expected 202, got {response.status_code}")
+                return False
+            
+            # A retry replays the same job, Location header included
+            replay = requests.post(f"{self.base_url}/tickets", json={"product_id": product_id, "quantity": 250}, headers=headers, timeout=10)
+            if replay.status_code != 202 or replay.json() != response.json() or replay.headers.get("Location") != response.headers.get("Location"):
+                self.log_test("Bulk Ticket Job", False, f"Replay differed: {replay.status_code} {replay.headers.get('Location')}")
+                return False
+            
+            job_id = response.json()["job_id"]
+            for _ in range(30):
+                job = requests.get(f"{self.base_url}/jobs/{job_id}", timeout=10).json()
+                if job["status"] in ("succeeded", "failed"):
+                    break
+                time.sleep(1)
+            
+            if job["status"] != "succeeded" or job["progress"] != 250:
+                self.log_test("Bulk Ticket Job", False, f"Job ended as {job['status']} with {job['progress']}/250 tickets")
+                return False
+            
+            self.log_test("Bulk Ticket Job", True, f"Job {job_id} issued 250 tickets")
+            return True
+            
+        except Exception as e:
+            self.log_test("Bulk Ticket Job", False, f"Exception: {str(e)}")
+            return False
+    
+    def test_offline_redemption_sync(self):
+        """Test offline reconciliation and that backdated scans still reach /sync"""
+        if not self.created_products:
+            self.log_test("Offline Redemption Sync", False, "No products created to test")
+            return False
+            
+        try:
+            product = self.created_products[0]
+            created = requests.post(f"{self.base_url}/tickets", json={"product_id": product["product_id"], "quantity": 1}, timeout=10)
+            if created.status_code != 200:
+                self.log_test("Offline Redemption Sync", False, f"Ticket creation failed with status {created.status_code}")
+                return False
+            ticket_id = created.json()[0]["id"]
+            
+            # Let the ticket's creation fall behind the cursor's safety window
+            time.sleep(6)
+            params = {}
+            while True:
+                page = requests.get(f"{self.base_url}/sync", params=params, timeout=10).json()
+                params = {"since": page["cursor"]}
+                if not page["has_more"]:
+                    break
+            cursor = params["since"]
+            
+            scanned_at = (datetime.utcnow() - timedelta(hours=1)).isoformat() + "Z"
+            batch = {"station_id": "test-station", "redemptions": [
+                {"ticket_id": ticket_id, "redeemed_at": scanned_at},
+                {"ticket_id": ticket_id, "redeemed_at": scanned_at},
+                {"ticket_id": str(uuid.uuid4()), "redeemed_at": scanned_at},
+            ]}
+            response = requests.post(f"{self.base_url}/tickets/redeem/offline", json=batch, timeout=10)
+            if response.status_code != 200:
+                self.log_test("Offline Redemption Sync", False, f"Upload failed with status {response.status_code}")
+                return False
+            statuses = [result["status"] for result in response.json()["results"]]
+            if statuses != ["redeemed", "duplicate", "not_found"]:
+                self.log_test("Offline Redemption Sync", False, f"Unexpected outcomes: {statuses}")
+                return False
+            
+            delta = requests.get(f"{self.base_url}/sync", params={"since": cursor}, timeout=10).json()
+            synced = [ticket for ticket in delta["tickets"] if ticket["id"] == ticket_id]
+            if not synced or not synced[0]["is_redeemed"]:
+                self.log_test("Offline Redemption Sync", False, "Backdated redemption missing from delta")
+                return False
+            
+            self.log_test("Offline Redemption Sync", True, "Backdated scan reconciled and returned by /sync")
+            return True
+            
+        except Exception as e:
+            self.log_test("Offline Redemption Sync", False, f"Exception: {str(e)}")
+            return False
+    
+    def test_report_cache(self):
+        """Test that a report ending mid-bucket gives the same answer with a cold or warm cache"""
+        try:
+            product_data = {"name": "Relatório", "value": 5.0, "stock": 2}
+            created = requests.post(f"{self.base_url}/products", json=product_data, timeout=10)
+            if created.status_code != 200:
+                self.log_test("Report Cache", False, f"Product creation failed with status {created.status_code}")
+                return False
+            product_id = created.json()["product_id"]
+            tickets = requests.post(f"{self.base_url}/tickets", json={"product_id": product_id, "quantity": 2}, timeout=10).json()
+            
+            # One scan early and one late in an hour that closed long ago
+            hour = (datetime.utcnow() - timedelta(hours=3)).replace(minute=0, second=0, microsecond=0)
+            batch = {"redemptions": [
+                {"ticket_id": tickets[0]["id"], "redeemed_at": (hour + timedelta(minutes=10)).isoformat() + "Z"},
+                {"ticket_id": tickets[1]["id"], "redeemed_at": (hour + timedelta(minutes=40)).isoformat() + "Z"},
+            ]}
+            requests.post(f"{self.base_url}/tickets/redeem/offline", json=batch, timeout=10)
+            
+            def redeemed(end):
+                params = {"tz": "UTC", "product_id": product_id, "start": hour.isoformat() + "Z", "end": end.isoformat() + "Z"}
+                return requests.get(f"{self.base_url}/reports/timeseries", params=params, timeout=10).json()["columns"]["redeemed"]
+            
+            partial = redeemed(hour + timedelta(minutes=30))
+            full = redeemed(hour + timedelta(hours=2))
+            if partial != [1] or full != [2]:
+                self.log_test("Report Cache", False, f"Expected [1] then [2], got {partial} then {full}")
+                return False
+            
+            # With the hour now cached, a report ending inside it must still count only up to end
+            partial = redeemed(hour + timedelta(minutes=30))
+            if partial != [1]:
+                self.log_test("Report Cache", False, f"Expected [1] from a warm cache, got {partial}")
+                return False
+            
+            self.log_test("Report Cache", True, "Partial buckets are neither cached nor served from the cache")
+            return True
+            
+        except Exception as e:
+            self.log_test("Report Cache", False, f"Exception: {str(e)}")
+            return False
+    
+    def test_read_replica_routing(self):
+        """Test that a signed read-your-writes token pins reads to the primary and a forged one does not"""
+        try:
+            created = requests.post(f"{self.base_url}/products", json={"name": "Réplica", "value": 1.0, "stock": 1}, timeout=10)
+            if created.status_code != 200:
+                self.log_test("Read Replica Routing", False, f"Product creation failed with status {created.status_code}")
+                return False
+            token = created.headers.get("X-Read-Primary-Until")
+            if token is None:
+                self.log_test("Read Replica Routing", True, "No read replica configured, nothing to route")
+                return True
+            product_id = created.json()["product_id"]
+            
+            pinned = requests.get(f"{self.base_url}/products/{product_id}", headers={"X-Read-Primary-Until": token}, timeout=10)
+            if pinned.status_code != 200:
+                self.log_test("Read Replica Routing", False, f"Read with the issued token got status {pinned.status_code}")
+                return False
+            
+            # An unsigned deadline must be ignored, sending the read to the replica; this expects a
+            # replica that is not replicating, like the copied SQLite file from the README
+            until = f"{time.time() + 3:.3f}"
+            for forged in (until, f"{until}.{'0' * 32}"):
+                response = requests.get(f"{self.base_url}/products/{product_id}", headers={"X-Read-Primary-Until": forged}, timeout=10)
+                if response.status_code != 404:
+                    self.log_test("Read Replica Routing", False, f"Forged token {forged!r} was honoured (status {response.status_code})")
+                    return False
+            
+            self.log_test("Read Replica Routing", True, "Signed token reads from the primary, forged tokens do not")
+            return True
+            
+        except Exception as e:
+            self.log_test("Read Replica Routing", False, f"Exception: {str(e)}")
+            return False
+    
+    def test_archived_ticket_fallthrough(self):
+        """Test that a redeemed ticket moved to the archive is still found and still redeemed"""
+        try:
+            created = requests.post(f"{self.base_url}/products", json={"name": "Arquivo", "value": 3.0, "stock": 1}, timeout=10)
+            if created.status_code != 200:
+                self.log_test("Archived Ticket Fall-through", False, f"Product creation failed with status {created.status_code}")
+                return False
+            product_id = created.json()["product_id"]
+            ticket_id = requests.post(f"{self.base_url}/tickets", json={"product_id": product_id, "quantity": 1}, timeout=10).json()[0]["id"]
+            redeemed = requests.post(f"{self.base_url}/tickets/redeem", json={"ticket_id": ticket_id}, timeout=10)
+            if redeemed.status_code != 200:
+                self.log_test("Archived Ticket Fall-through", False, f"Redemption failed with status {redeemed.status_code}")
+                return False
+            
+            archived = requests.post(f"{self.base_url}/admin/archive/tickets", params={"older_than_days": 0}, timeout=30)
+            if archived.status_code != 200:
+                self.log_test("Archived Ticket Fall-through", False, f"Archival failed with status {archived.status_code}")
+                return False
+            
+            ticket = requests.get(f"{self.base_url}/tickets/{ticket_id}", timeout=10)
+            if ticket.status_code != 200 or not ticket.json()["is_redeemed"]:
+                self.log_test("Archived Ticket Fall-through", False, f"Archived ticket lookup got status {ticket.status_code}")
+                return False
+            
+            by_product = requests.get(f"{self.base_url}/tickets/product/{product_id}", timeout=10).json()
+            if ticket_id not in [item["id"] for item in by_product]:
+                self.log_test("Archived Ticket Fall-through", False, "Archived ticket missing from the product's tickets")
+                return False
+            
+            again = requests.post(f"{self.base_url}/tickets/redeem", json={"ticket_id": ticket_id}, timeout=10)
+            if again.status_code != 400 or "already redeemed" not in again.json().get("detail", ""):
+                self.log_test("Archived Ticket Fall-through", False, f"Second redemption expected 400 already redeemed, got {again.status_code}")
+                return False
+            
+            self.log_test("Archived Ticket Fall-through", True, "Archived ticket found by id and product, and not redeemable again")
+            return True
+            
+        except Exception as e:
+            self.log_test("Archived Ticket Fall-through", False, f"Exception: {str(e)}")
+            return False
+    
+    def test_ticket_printing(self):
+        """Test that issued tickets render as a PDF"""
+        try:
+            created = requests.post(f"{self.base_url}/products", json={"name": "Impressão", "value": 4.0, "stock": 2}, timeout=10)
+            if created.status_code != 200:
+                self.log_test("Ticket Printing", False, f"Product creation failed with status {created.status_code}")
+                return False
+            tickets = requests.post(f"{self.base_url}/tickets", json={"product_id": created.json()["product_id"], "quantity": 2}, timeout=10).json()
+            
+            response = requests.get(f"{self.base_url}/tickets/print", params={"ids": ",".join(ticket["id"] for ticket in tickets)}, timeout=30)
+            if response.status_code != 200 or not response.content.startswith(b"%PDF"):
+                self.log_test("Ticket Printing", False, f"Expected a PDF, got status {response.status_code}")
+                return False
+            
+            self.log_test("Ticket Printing", True, f"Printed {len(tickets)} tickets as a {len(response.content)} byte PDF")
+            return True
+            
+        except Exception as e:
+            self.log_test("Ticket Printing", False, f"Exception: {str(e)}")
+            return False
+    
+    def test_search(self):
+        """Test that a freshly issued ticket and its product are found by search"""
+        try:
+            name = f"Busca {uuid.uuid4().hex[:6]}"
+            created = requests.post(f"{self.base_url}/products", json={"name": name, "value": 2.0, "stock": 1}, timeout=10)
+            if created.status_code != 200:
+                self.log_test("Search", False, f"Product creation failed with status {created.status_code}")
+                return False
+            ticket = requests.post(f"{self.base_url}/tickets", json={"product_id": created.json()["product_id"], "quantity": 1}, timeout=10).json()[0]
+            
+            found = requests.get(f"{self.base_url}/search", params={"q": ticket["ticket_number"], "kind": "ticket"}, timeout=10).json()
+            if ticket["id"] not in [hit["ticket"]["id"] for hit in found["hits"]]:
+                self.log_test("Search", False, f"Ticket {ticket['ticket_number']} not found by search")
+                return False
+            
+            found = requests.get(f"{self.base_url}/search", params={"q": name.split()[1], "kind": "product"}, timeout=10).json()
+            if created.json()["product_id"] not in [hit["product"]["product_id"] for hit in found["hits"]]:
+                self.log_test("Search", False, f"Product {name} not found by search")
+                return False
+            
+            self.log_test("Search", True, "Ticket number and product name found")
+            return True
+            
+        except Exception as e:
+            self.log_test("Search", False, f"Exception: {str(e)}")
+            return False
+    
+    def test_qr_image(self):
+        """Test that a product's qr_code_url serves a PNG"""
+        try:
+            created = requests.post(f"{self.base_url}/products", json={"name": "QR", "value": 1.5, "stock": 1}, timeout=10)
+            if created.status_code != 200:
+                self.log_test("QR Image", False, f"Product creation failed with status {created.status_code}")
+                return False
+            
+            qr_url = created.json()["qr_code_url"]
+            response = requests.get(f"{self.base_url.rsplit('/api', 1)[0]}{qr_url}", timeout=10)
+            if response.status_code != 200 or response.headers.get("content-type") != "image/png":
+                self.log_test("QR Image", False, f"Expected image/png, got status {response.status_code} and {response.headers.get('content-type')}")
+                return False
+            
+            self.log_test("QR Image", True, f"{qr_url} served as image/png")
+            return True
+            
+        except Exception as e:
+            self.log_test("QR Image", False, f"Exception: {str(e)}")
+            return False
+    
     def run_comprehensive_test_scenario(self):
         """Run the complete test scenario as requested"""
         print("\n" + "="*80)
@@ -530,6 +918,17 @@ class BackendTester:
             ("Nonexistent Ticket Redemption", self.test_nonexistent_ticket_redemption),
             ("Get Specific Ticket", self.test_get_specific_ticket),
             ("Nonexistent Product Operations", self.test_nonexistent_product_operations),
+            ("Idempotent Ticket Creation", self.test_idempotent_ticket_creation),
+            ("Delta Sync", self.test_delta_sync),
+            ("Stock Adjustment", self.test_stock_adjustment),
+            ("Bulk Ticket Job", self.test_bulk_ticket_job),
+            ("Offline Redemption Sync", self.test_offline_redemption_sync),
+            ("Report Cache", self.test_report_cache),
+            ("Read Replica Routing", self.test_read_replica_routing),
+            ("Archived Ticket Fall-through", self.test_archived_ticket_fallthrough),
+            ("Ticket Printing", self.test_ticket_printing),
+            ("Search", self.test_search),
+            ("QR Image", self.test_qr_image),
         ]
         
         passed = 0
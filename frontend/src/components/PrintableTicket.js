@@ -26,9 +26,9 @@ const PrintableTicket = ({ tickets, product, onClose }) => {
           <p style={{ margin: '2px 0' }}><strong>Valor:</strong> R$ {ticket.product_value.toFixed(2)}</p>
           <p style={{ margin: '2px 0' }}><strong>Status:</strong> {ticket.is_redeemed ? 'Resgatado' : 'Ativo'}</p>
           <p style={{ margin: '2px 0' }}><strong>Data:</strong> {new Date(ticket.created_at).toLocaleString('pt-BR')}</p>
-          {product.qr_code_image && (
+          {product.qr_code_url && (
             <img
-              src={`data:image/png;base64,${product.qr_code_image}`}
+              src={`${BACKEND_URL}${product.qr_code_url}`}
               alt="QR Code"
               style={{ width: '60px', height: '60px', margin: '5px auto', display: 'block' }}
             />
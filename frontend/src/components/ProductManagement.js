@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { Button } from './ui/button';
 import { Input } from './ui/input';
@@ -16,6 +16,42 @@ import QRScannerComponent from './QRScannerComponent';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// After a write the backend answers with X-Read-Primary-Until; sending it back on the next
+// requests keeps our reads on the primary database until the read replica has caught up
+let readPrimaryUntil = null;
+axios.interceptors.response.use(response => {
+  const marker = response.headers['x-read-primary-until'];
+  if (marker) readPrimaryUntil = marker;
+  return response;
+});
+axios.interceptors.request.use(config => {
+  if (readPrimaryUntil && parseFloat(readPrimaryUntil) * 1000 > Date.now()) {
+    config.headers['X-Read-Primary-Until'] = readPrimaryUntil;
+  }
+  return config;
+});
+
+const newIdempotencyKey = () =>
+  window.crypto?.randomUUID
+    ? window.crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
+// Lost responses and busy/in-progress answers are retried with the same Idempotency-Key,
+// so the backend replays the first result instead of issuing or redeeming twice
+const RETRYABLE_STATUS = [409, 429, 502, 503, 504];
+const postIdempotent = async (url, data, key, attempts = 3) => {
+  for (let attempt = 1; ; attempt++) {
+    try {
+      return await axios.post(url, data, { headers: { 'Idempotency-Key': key } });
+    } catch (error) {
+      const retryable = !error.response || RETRYABLE_STATUS.includes(error.response.status);
+      if (!retryable || attempt >= attempts) throw error;
+      const retryAfter = parseFloat(error.response?.headers?.['retry-after']);
+      await new Promise(resolve => setTimeout(resolve, (retryAfter || attempt) * 1000));
+    }
+  }
+};
+
 
 
 const ProductManagement = () => {
@@ -45,6 +81,9 @@ const ProductManagement = () => {
   const [stockToAdd, setStockToAdd] = useState({});
   const [editingProduct, setEditingProduct] = useState(null);
   const [showEditProductDialog, setShowEditProductDialog] = useState(false);
+  // One key per issuance/redemption attempt, kept until it succeeds so a manual retry reuses it
+  const issueAttempt = useRef(null);
+  const redeemKeys = useRef({});
 
   // Fetch products
   const fetchProducts = async () => {
@@ -74,7 +113,6 @@ const ProductManagement = () => {
       toast.success('Produto atualizado com sucesso!');
       setShowEditProductDialog(false);
       setEditingProduct(null);
-      fetchProducts();
     } catch (error) {
       console.error('Error updating product:', error);
       toast.error(typeof error.response?.data?.detail === 'object' ? JSON.stringify(error.response.data.detail) : error.response?.data?.detail || 'Erro ao atualizar produto');
@@ -123,6 +161,53 @@ const ProductManagement = () => {
     fetchTickets();
   }, []);
 
+  // Live updates pushed by the backend instead of re-fetching the lists
+  useEffect(() => {
+    const events = new EventSource(`${API}/events`);
+
+    const upsertProduct = (event) => {
+      const product = JSON.parse(event.data);
+      setProducts(prevProducts => {
+        const exists = prevProducts.some(p => p.product_id === product.product_id);
+        return exists
+          ? prevProducts.map(p => (p.product_id === product.product_id ? product : p))
+          : [...prevProducts, product];
+      });
+    };
+
+    events.addEventListener('product.created', upsertProduct);
+    events.addEventListener('product.updated', upsertProduct);
+    events.addEventListener('product.deleted', (event) => {
+      const { product_id } = JSON.parse(event.data);
+      setProducts(prevProducts => prevProducts.filter(p => p.product_id !== product_id));
+    });
+    events.addEventListener('tickets.issued', (event) => {
+      const { product_id, tickets: issued } = JSON.parse(event.data);
+      setTickets(prevTickets => {
+        const known = new Set(prevTickets.map(t => t.id));
+        return [...prevTickets, ...issued.filter(t => !known.has(t.id))];
+      });
+      setProductTicketCounts(prevCounts => ({
+        ...prevCounts,
+        [product_id]: (prevCounts[product_id] || 0) + issued.length
+      }));
+    });
+    events.addEventListener('ticket.redeemed', (event) => {
+      const ticket = JSON.parse(event.data);
+      setTickets(prevTickets => prevTickets.filter(t => t.id !== ticket.id));
+    });
+    events.addEventListener('tickets.redeemed', (event) => {
+      const redeemed = new Set(JSON.parse(event.data).ticket_ids);
+      setTickets(prevTickets => prevTickets.filter(t => !redeemed.has(t.id)));
+    });
+    events.addEventListener('resync', () => {
+      fetchProducts();
+      fetchTickets();
+    });
+
+    return () => events.close();
+  }, []);
+
   // Edit product
   const handleEditProduct = (product) => {
     setEditingProduct({ ...product });
@@ -145,7 +230,6 @@ const ProductManagement = () => {
       
       setNewProduct({ name: '', value: '', stock: '' });
       setShowProductDialog(false);
-      fetchProducts();
     } catch (error) {
       console.error('Error creating product:', error);
       toast.error(typeof error.response?.data?.detail === 'object' ? JSON.stringify(error.response.data.detail) : error.response?.data?.detail || 'Erro ao criar produto');
@@ -166,13 +250,25 @@ const ProductManagement = () => {
     
     try {
       setLoading(true);
-      const response = await axios.post(`${API}/tickets`, {
+      const payload = {
         product_id: selectedProduct.product_id,
         quantity: parseInt(ticketQuantity)
-      });
-      
-      toast.success(`${ticketQuantity} ticket(s) criado(s) com sucesso!`);
+      };
+      const payloadKey = JSON.stringify(payload);
+      if (issueAttempt.current?.payload !== payloadKey) {
+        issueAttempt.current = { payload: payloadKey, key: newIdempotencyKey() };
+      }
+      const response = await postIdempotent(`${API}/tickets`, payload, issueAttempt.current.key);
+      issueAttempt.current = null;
+
       setShowTicketDialog(false);
+      if (response.status === 202) {
+        // Large batches are issued in the background; the list updates through the event stream
+        toast.success(`${ticketQuantity} tickets sendo gerados em segundo plano.`);
+        setTicketQuantity(1);
+        return;
+      }
+      toast.success(`${ticketQuantity} ticket(s) criado(s) com sucesso!`);
       
       // Show printable tickets
       setPrintData({
@@ -182,8 +278,6 @@ const ProductManagement = () => {
       setShowPrintDialog(true);
       
       setTicketQuantity(1);
-      fetchProducts(); // Refresh to update stock
-      fetchTickets();
     } catch (error) {
       console.error('Error creating tickets:', error);
       toast.error('Erro ao criar tickets. Verifique se o produto está ativo e se há estoque suficiente.');
@@ -196,7 +290,9 @@ const ProductManagement = () => {
   const handleRedeemTicket = async (ticketId) => {
     try {
       setLoading(true);
-      const response = await axios.post(`${API}/tickets/redeem`, { ticket_id: ticketId });
+      redeemKeys.current[ticketId] = redeemKeys.current[ticketId] || newIdempotencyKey();
+      const response = await postIdempotent(`${API}/tickets/redeem`, { ticket_id: ticketId }, redeemKeys.current[ticketId]);
+      delete redeemKeys.current[ticketId];
       toast.success('Ticket resgatado com sucesso!');
 
       // Remove the redeemed ticket from the local state
@@ -226,9 +322,8 @@ const ProductManagement = () => {
     }
     try {
       setLoading(true);
-      await axios.put(`${API}/products/${productId}`, { stock: quantity });
+      await axios.post(`${API}/products/${productId}/stock`, { delta: quantity });
       toast.success('Estoque atualizado com sucesso!');
-      fetchProducts(); // Refresh product list
       setStockToAdd({ ...stockToAdd, [productId]: '' }); // Clear input
     } catch (error) {
       console.error('Error adding stock:', error);
@@ -243,7 +338,6 @@ const ProductManagement = () => {
       setLoading(true);
       await axios.put(`${API}/products/${productId}`, { status: newStatus });
       toast.success(`Produto ${newStatus === 'active' ? 'habilitado' : 'desabilitado'} com sucesso!`);
-      fetchProducts();
     } catch (error) {
       console.error('Error toggling product status:', error);
       toast.error('Erro ao alterar status do produto.');
@@ -761,9 +855,9 @@ const filteredProducts = products.filter((product) =>
             </DialogDescription>
           </DialogHeader>
           <div className="flex flex-col items-center space-y-4">
-            {selectedProduct?.qr_code_image && (
+            {selectedProduct?.qr_code_url && (
               <img 
-                src={`data:image/png;base64,${selectedProduct.qr_code_image}`}
+                src={`${BACKEND_URL}${selectedProduct.qr_code_url}`}
                 alt="QR Code"
                 className="max-w-xs border rounded"
               />
@@ -793,10 +887,20 @@ const filteredProducts = products.filter((product) =>
           {printData && (
             <PrintableTicket
           tickets={printData.tickets}
-          product={{...printData.product, qr_code_image: selectedProduct?.qr_code_image}}
+          product={{...printData.product, qr_code_url: selectedProduct?.qr_code_url}}
           onClose={() => setShowPrintDialog(false)}
         />
           )}
+          {printData && (
+            <DialogFooter>
+              <Button
+                variant="outline"
+                onClick={() => window.open(`${API}/tickets/print?ticket_numbers=${printData.tickets.map(t => t.ticket_number).join(',')}`, '_blank')}
+              >
+                Gerar PDF
+              </Button>
+            </DialogFooter>
+          )}
         </DialogContent>
       </Dialog>
     </div>